@@ -5,151 +5,76 @@ Parse downloaded BRFSS ZIPs (CDC) that contain SAS XPT files, one year at a time
 
 - Reads each ZIP from data/raw/brfss_zips/
 - Extracts the first .XPT inside (case-insensitive; tolerates trailing spaces)
-- Saves the raw .XPT to data/raw/brfss_year/raw_xpt/brfss_<year>.xpt
+  to a scratch file (use 02a_extract_xpts.py to keep raw .XPT copies)
 - Parses to pandas (pyreadstat preferred; pandas.read_sas fallback)
 - Minimal normalization: lowercase columns, add `year`, derive FIPS if _STATE/_CNTY exist
-- Writes per-year CSV and Parquet to data/raw/brfss_year/
-- Resume-safe: if a year's CSV already exists, it's skipped.
+- Writes per-year Parquet (ZSTD) to data/raw/brfss_year/; CSV only with --emit-csv
+- Resume-safe: if a year's Parquet already exists, it's skipped.
 
 Usage:
   python scripts/02_parse_brfss_xpt.py 2010 2011 2012
+  python scripts/02_parse_brfss_xpt.py --jobs 4 --emit-csv 2010 2011
+  python scripts/02_parse_brfss_xpt.py --columns keep_columns.json 2019
 """
 
 from __future__ import annotations
 
-import io
+import os
 import sys
 import json
-import zipfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import Optional, List
 
-import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
-ZIPS_DIR = Path("data/raw/brfss_zips")
-OUT_DIR  = Path("data/raw/brfss_year")
-RAW_XPT_DIR = OUT_DIR / "raw_xpt"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-RAW_XPT_DIR.mkdir(parents=True, exist_ok=True)
+from _zip_xpt import (
+    OUT_DIR,
+    RAW_XPT_DIR,
+    ZIPS_DIR,
+    extract_xpt_to,
+    find_zip_for_year,
+    normalize_inplace,
+    read_xpt_robust,
+)
 
 
 # ---------- helpers ----------
 
-def find_zip_for_year(year: int) -> Optional[Path]:
+def extract_and_save_xpt(zip_path: Path, year: int, save_raw: bool = True) -> Optional[Path]:
     """
-    Find a ZIP in ZIPS_DIR for the given year, case-insensitively.
-    Accepts names like CDBRFS00XPT.ZIP, LLCP2019XPT.zip, etc.
-    Prefers files whose name contains both the year fragment and 'xpt'.
+    Stream the ZIP's XPT to disk and return that path. With save_raw=True
+    the copy is kept at data/raw/brfss_year/raw_xpt/brfss_<year>.xpt for
+    provenance; with save_raw=False it goes to a scratch temp file the
+    caller deletes after parsing — the original ZIP already preserves the
+    raw XPT, so parse_year doesn't need a second permanent copy per year
+    (use 02a_extract_xpts.py when the XPT itself is the wanted output).
     """
-    if not ZIPS_DIR.exists():
-        return None
-
-    y2, y4 = f"{year%100:02d}", str(year)
-
-    # collect candidates (any .zip/.zipx, any case)
-    cands: List[Path] = []
-    for p in ZIPS_DIR.iterdir():
-        if not p.is_file():
-            continue
-        name = p.name.lower()
-        if not (name.endswith(".zip") or name.endswith(".zipx")):
-            continue
-        if (y2 in name or y4 in name):
-            cands.append(p)
-
-    if not cands:
+    if save_raw:
+        out_path = RAW_XPT_DIR / f"brfss_{year}.xpt"
+    else:
+        fd, tmp = tempfile.mkstemp(prefix=f"brfss_{year}_", suffix=".xpt")
+        os.close(fd)
+        out_path = Path(tmp)
+
+    if not extract_xpt_to(zip_path, out_path):
+        if not save_raw:
+            out_path.unlink(missing_ok=True)
         return None
+    return out_path
 
-    # prefer ones that also include 'xpt' in the filename
-    with_xpt = [p for p in cands if "xpt" in p.name.lower()]
-    if with_xpt:
-        cands = with_xpt
-
-    # deterministic: sort by name and pick the first
-    cands.sort(key=lambda p: p.name.lower())
-    return cands[0]
-
-
-def extract_and_save_xpt(zip_path: Path, year: int) -> Optional[bytes]:
-    """
-    Return bytes of the first *.xpt file in the ZIP (case-insensitive),
-    tolerating entries with trailing spaces (e.g., 'LLCP2019.XPT '),
-    and also save a verbatim copy as data/raw/brfss_year/raw_xpt/brfss_<year>.xpt
-    """
-    try:
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            names = zf.namelist()
-            # normalize names for matching (strip whitespace) but keep original for reading
-            for original in names:
-                cleaned = original.strip()
-                if cleaned.lower().endswith(".xpt"):
-                    raw_bytes = zf.read(original)  # use original entry name
-                    # save raw XPT for provenance
-                    out_path = RAW_XPT_DIR / f"brfss_{year}.xpt"
-                    out_path.write_bytes(raw_bytes)
-                    return raw_bytes
-            return None
-    except Exception as e:
-        raise RuntimeError(f"Error reading ZIP {zip_path.name}: {e}")
-
-
-def read_xpt_robust(xpt_bytes: bytes) -> pd.DataFrame:
-    """
-    Try pyreadstat (new/old signatures), else pandas.read_sas(format='xport').
-    Returns a pandas DataFrame or raises RuntimeError.
-    """
-    try:
-        import pyreadstat
-        try:
-            df, _ = pyreadstat.read_xport(
-                io.BytesIO(xpt_bytes),
-                apply_value_formats=False,
-                formats_as_category=False,
-            )
-            return df
-        except TypeError:
-            # older pyreadstat signature without keyword args
-            df, _ = pyreadstat.read_xport(io.BytesIO(xpt_bytes))
-            return df
-    except Exception:
-        pass
-
-    # pandas fallback
-    try:
-        df = pd.read_sas(io.BytesIO(xpt_bytes), format="xport")
-        return df
-    except Exception as e:
-        raise RuntimeError(f"Failed to read XPT with pyreadstat and pandas: {e}")
-
-
-def normalize(df: pd.DataFrame, year: int) -> pd.DataFrame:
-    """
-    Minimal normalization:
-      - lowercase all column names
-      - add `year`
-      - if _STATE/_CNTY exist, create `state_fips` (2-digit) and `fips` (5-digit)
-    """
-    df = df.copy()
-    df.columns = [c.strip().lower() for c in df.columns]
-    df["year"] = year
-
-    # _STATE and _CNTY variable names are uppercase in many BRFSS years
-    if "_state" in df.columns:
-        s = pd.to_numeric(df["_state"], errors="coerce").astype("Int64")
-        df["state_fips"] = s.astype("string").str.zfill(2)
-
-    if "_cnty" in df.columns:
-        c = pd.to_numeric(df["_cnty"], errors="coerce").astype("Int64")
-        df["county_fips3"] = c.astype("string").str.zfill(3)
-        if "state_fips" in df.columns:
-            df["fips"] = (df["state_fips"].fillna("") + df["county_fips3"].fillna(""))
-
-    return df
 
-
-def parse_year(year: int) -> dict:
+def parse_year(year: int, emit_csv: bool = False,
+               columns: Optional[List[str]] = None) -> dict:
     """
-    Parse one year's ZIP -> XPT -> DataFrame -> CSV/Parquet.
+    Parse one year's ZIP -> XPT -> DataFrame -> Parquet (CSV is opt-in;
+    it writes ~10-30x slower than Parquet and several times the bytes).
+    `columns` restricts the decode to that variable subset (include
+    _STATE/_CNTY there if the FIPS derivation should still run).
     Returns a summary dict with status/rows/cols.
     """
     zip_path = find_zip_for_year(year)
@@ -158,25 +83,56 @@ def parse_year(year: int) -> dict:
 
     csv_path = OUT_DIR / f"brfss_{year}.csv"
     pq_path  = OUT_DIR / f"brfss_{year}.parquet"
-    if csv_path.exists():
-        return {"year": year, "status": "skipped_existing", "rows": None, "cols": None}
-
-    xpt_bytes = extract_and_save_xpt(zip_path, year)
-    if not xpt_bytes:
+    # a year only counts as done if every requested output exists: with
+    # --emit-csv a surviving Parquet alone must not skip the CSV write
+    if pq_path.exists() and (not emit_csv or csv_path.exists()):
+        if pq_path.stat().st_size > 0:
+            try:
+                # O(1) footer read: report shape without touching the data
+                md = pq.read_metadata(pq_path)
+                return {
+                    "year": year, "status": "skipped_existing",
+                    "rows": md.num_rows, "cols": md.num_columns,
+                }
+            except Exception:
+                pass  # unreadable footer: fall through and re-parse
+        # empty or truncated output from a crashed run
+        pq_path.unlink()
+
+    xpt_path = extract_and_save_xpt(zip_path, year, save_raw=False)
+    if not xpt_path:
         return {"year": year, "status": "xpt_not_in_zip", "rows": None, "cols": None}
 
     try:
-        df = read_xpt_robust(xpt_bytes)
-        df = normalize(df, year)
+        df = read_xpt_robust(xpt_path, columns=columns)
+        df = normalize_inplace(df, year)
     except Exception as e:
         return {"year": year, "status": f"parse_error: {e}", "rows": None, "cols": None}
+    finally:
+        xpt_path.unlink(missing_ok=True)  # scratch copy; the ZIP keeps the raw XPT
 
     try:
-        df.to_csv(csv_path, index=False)
-        try:
-            df.to_parquet(pq_path, index=False)
-        except Exception:
-            pass
+        # explicit writer settings instead of to_parquet defaults (Snappy,
+        # one giant row group): ~128k-row groups give downstream readers
+        # 3-4 prunable/parallel groups per year, V2 pages + ZSTD shrink
+        # the files further
+        # combine_chunks is one memcpy per column and keeps the writer off
+        # its pathological many-small-chunks path if any column arrived
+        # multi-chunked (e.g. arrow-backed dtypes)
+        table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+        pq.write_table(
+            table, pq_path,
+            compression="zstd", compression_level=3,
+            use_dictionary=True, data_page_version="2.0",
+            row_group_size=128_000, write_statistics=True,
+        )
+        if emit_csv:
+            # Arrow's C++ CSV writer reuses the table built for Parquet
+            # and runs several times faster than DataFrame.to_csv
+            pacsv.write_csv(
+                table, csv_path,
+                write_options=pacsv.WriteOptions(include_header=True),
+            )
     except Exception as e:
         return {"year": year, "status": f"write_error: {e}", "rows": None, "cols": None}
 
@@ -195,29 +151,46 @@ def main(argv: list[str]) -> None:
         print("Example: python scripts/02_parse_brfss_xpt.py 2014 2015 2016 2017 2018 2019 2020")
         sys.exit(1)
 
+    emit_csv = "--emit-csv" in argv
+    jobs = 0
+    columns: Optional[List[str]] = None
     years: List[int] = []
-    for a in argv:
+    skip_next = False
+    for i, a in enumerate(argv):
+        if skip_next:
+            skip_next = False
+            continue
+        if a == "--emit-csv":
+            continue
+        if a == "--jobs" and i + 1 < len(argv):
+            jobs = int(argv[i + 1])
+            skip_next = True
+            continue
+        if a == "--columns" and i + 1 < len(argv):
+            # JSON manifest: a flat list of BRFSS variable names to keep
+            columns = json.loads(Path(argv[i + 1]).read_text())
+            skip_next = True
+            continue
         try:
             years.append(int(a))
         except ValueError:
             print(f"Skipping non-year argument: {a}")
 
-    results = []
-    for y in years:
-        res = parse_year(y)
-        print(res)
-        results.append(res)
-
-    # append to summary file
-    summary_path = OUT_DIR / "_parse_summary.json"
-    try:
-        existing = []
-        if summary_path.exists():
-            existing = json.loads(summary_path.read_text())
-        existing.extend(results)
-        summary_path.write_text(json.dumps(existing, indent=2))
-    except Exception:
-        pass
+    # years are fully independent (own ZIP, own outputs), so parse them
+    # across processes; pyreadstat/pandas hold the GIL during their C work
+    # so threads would not help here
+    max_workers = jobs or min(len(years), os.cpu_count() or 1) or 1
+    # append-only JSONL summary: one line per result as it completes, so
+    # a killed run keeps every finished year's status (no read-extend-
+    # rewrite of a growing JSON) and progress can be tail-followed
+    summary_path = OUT_DIR / "_parse_summary.jsonl"
+    with summary_path.open("a") as f, ProcessPoolExecutor(max_workers=max_workers) as ex:
+        for res in ex.map(
+            partial(parse_year, emit_csv=emit_csv, columns=columns), years
+        ):
+            print(res)
+            f.write(json.dumps(res) + "\n")
+            f.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+"""
+02a_extract_xpts.py
+-------------------
+Extract raw SAS XPT files out of the downloaded BRFSS ZIPs without
+parsing them, saving one file per year to data/raw/brfss_year/raw_xpt/.
+Use this when the transport file itself is the wanted output (archival,
+sharing, feeding the metadata scanner); 02_parse_brfss_xpt.py no longer
+keeps a raw copy on its own.
+
+- brfss_<year>.xpt naming, matching the rest of the pipeline
+- With explicit years, matches ZIPs the same way as 02_parse_brfss_xpt
+- With --all, walks every ZIP in data/raw/brfss_zips/ and infers the
+  year from the filename
+- Resume-safe: existing XPTs are skipped.
+
+Usage:
+  python scripts/02a_extract_xpts.py 2010 2011
+  python scripts/02a_extract_xpts.py --all
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+from pathlib import Path
+from typing import Optional, List
+
+from _zip_xpt import (
+    RAW_XPT_DIR,
+    ZIPS_DIR,
+    _list_zip_candidates,
+    extract_xpt_to,
+    find_zip_for_year,
+)
+
+# 4-digit year, or an isolated 2-digit year; one compiled pattern, one
+# search per filename (alternation order prefers the 4-digit form at any
+# given position)
+_YEAR_IN_NAME_RE = re.compile(r"((?:19|20)\d{2})|(?<!\d)(\d{2})(?!\d)")
+
+
+# ---------- helpers ----------
+
+def infer_year_from_name(name: str) -> Optional[int]:
+    """
+    Guess the survey year from a ZIP filename:
+    LLCP2019XPT.zip -> 2019, CDBRFS00XPT.ZIP -> 2000, cdbrfs87xpt.zip -> 1987.
+    """
+    m = _YEAR_IN_NAME_RE.search(name.lower())
+    if not m:
+        return None
+    if m.group(1):
+        return int(m.group(1))
+    yy = int(m.group(2))
+    # BRFSS started in 1984
+    return 1900 + yy if yy >= 84 else 2000 + yy
+
+
+def save_xpt_for_year(year: int, zip_path: Path) -> dict:
+    """Extract one year's XPT to RAW_XPT_DIR. Returns a summary dict."""
+    out_path = RAW_XPT_DIR / f"brfss_{year}.xpt"
+    if out_path.exists():
+        return {"year": year, "status": "skipped_existing"}
+
+    if not extract_xpt_to(zip_path, out_path):
+        return {"year": year, "status": "xpt_not_in_zip"}
+
+    return {"year": year, "status": "ok", "bytes": out_path.stat().st_size}
+
+
+def process_all() -> List[dict]:
+    """Extract the XPT from every ZIP in ZIPS_DIR, inferring years from names."""
+    results: List[dict] = []
+    for name, p in sorted(_list_zip_candidates()):
+        year = infer_year_from_name(p.name)
+        if year is None:
+            print(f"Could not infer year from {p.name}; skipping")
+            continue
+        res = save_xpt_for_year(year, p)
+        print(res)
+        results.append(res)
+    return results
+
+
+# ---------- CLI ----------
+
+def main(argv: list[str]) -> None:
+    if not ZIPS_DIR.exists():
+        print("ZIPS_DIR not found:", ZIPS_DIR.resolve())
+        sys.exit(1)
+
+    if not argv:
+        print("Usage: python scripts/02a_extract_xpts.py YEAR [YEAR ...] | --all")
+        sys.exit(1)
+
+    if "--all" in argv:
+        process_all()
+        return
+
+    for a in argv:
+        try:
+            year = int(a)
+        except ValueError:
+            print(f"Skipping non-year argument: {a}")
+            continue
+        zip_path = find_zip_for_year(year)
+        if not zip_path:
+            print({"year": year, "status": "zip_not_found"})
+            continue
+        print(save_xpt_for_year(year, zip_path))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
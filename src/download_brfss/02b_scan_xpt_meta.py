@@ -0,0 +1,370 @@
+"""
+02b_scan_xpt_meta.py
+--------------------
+Scan the raw BRFSS XPT files (saved by 02_parse_brfss_xpt.py) and build a
+combined variable index: one row per (year, variable) with the variable's
+label and value-label/format table, for use when curating the rename maps
+in 03_brfss_batchprocess.
+
+- Reads data/raw/brfss_year/raw_xpt/brfss_<year>.xpt
+- Parses variable names/labels straight out of the XPORT header NAMESTR
+  records (a few KiB from the front of each file; no data rows are read).
+  pyreadstat is only used as a fallback when the header doesn't look like
+  SAS XPORT v5/v8.
+- Writes per-year data/metadata/vars_<year>.csv
+- Writes a combined index to data/metadata/brfss_var_index.parquet
+- Writes run stats to data/metadata/_scan_summary.json
+
+Usage:
+  python scripts/02b_scan_xpt_meta.py
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+try:
+    import orjson  # C JSON encoder; optional
+except ImportError:
+    orjson = None
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+RAW_XPT_DIR = Path("data/raw/brfss_year/raw_xpt")
+OUT_DIR = Path("data/metadata")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+COMBINED_PATH = OUT_DIR / "brfss_var_index.parquet"
+SUMMARY_JSON = OUT_DIR / "_scan_summary.json"
+META_CACHE_PATH = OUT_DIR / ".xpt_meta_cache.pkl"
+
+_YEAR_RE = re.compile(r"brfss_(\d{4})\.xpt$")
+
+
+# ---------- XPORT header parsing ----------
+
+# SAS XPORT (v5/v8) files start with fixed 80-byte "card image" records.
+_LIBRARY_MAGIC = b"HEADER RECORD*******LIBRARY HEADER RECORD!!!!!!!"
+_MEMBER_MAGIC  = b"HEADER RECORD*******MEMBER  HEADER RECORD!!!!!!!"
+_NAMESTR_MAGIC = b"HEADER RECORD*******NAMESTR HEADER RECORD!!!!!!!"
+
+# NAMESTR record layout (big-endian, fixed offsets):
+#   ntype/nhfun/nlng/nvar0 (4×h), nname (8s @8), nlabel (40s @16),
+#   nform (8s @56); the remaining fields pad each record to a stride of
+#   140 (or 136) bytes. Only the prefix is unpacked.
+_NAMESTR_PREFIX_FMT = ">hhhh8s40s8s"
+
+
+def _decode(field: bytes) -> str:
+    return field.decode("ascii", errors="replace").strip()
+
+
+def read_xpt_meta_pyreadstat(xpt_path: Path) -> dict:
+    """Fallback: full pyreadstat metadata read (slow path)."""
+    import pyreadstat
+
+    _, meta = pyreadstat.read_xport(str(xpt_path), metadataonly=True)
+    return {
+        "column_names": list(meta.column_names),
+        # guarantee str here so downstream never needs a defensive cast
+        "column_labels": [lbl if isinstance(lbl, str) else "" for lbl in meta.column_labels],
+        "variable_value_labels": dict(meta.variable_to_label),
+    }
+
+
+def read_xpt_meta_fallback(xpt_path: Path) -> dict:
+    """
+    Reader-library fallback for files whose header isn't plain XPORT v5/v8.
+    Prefers polars-readstat (Rust engine, metadata-only API, no data rows
+    read) when installed, else the pyreadstat metadata path.
+    """
+    try:
+        from polars_readstat import ScanReadstat
+    except ImportError:
+        return read_xpt_meta_pyreadstat(xpt_path)
+
+    cols = ScanReadstat(path=str(xpt_path)).metadata["columns"]
+    return {
+        "column_names": [c["name"] for c in cols],
+        "column_labels": [c.get("label") or c["name"] or "" for c in cols],
+        "variable_value_labels": {
+            c["name"]: c["value_labels"] for c in cols if c.get("value_labels")
+        },
+    }
+
+
+def read_xpt_meta(xpt_path: Path) -> dict:
+    """
+    Read variable names/labels/format tables from the XPORT header only.
+
+    XPORT stores all variable metadata in fixed-offset NAMESTR records in
+    the first few 80-byte header blocks, so this touches ~4-16 KiB per file
+    instead of scanning whole multi-hundred-MB XPTs through readstat.
+    Falls back to pyreadstat when the magic bytes don't match.
+    """
+    try:
+        # mmap lets the kernel page-cache the small header prefix across
+        # runs and avoids a separate bytes buffer per file.
+        with open(xpt_path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            if len(mm) < 160 or mm[: len(_LIBRARY_MAGIC)] != _LIBRARY_MAGIC:
+                return read_xpt_meta_fallback(xpt_path)
+
+            namestr_len = 140
+            n_vars = None
+            # Walk header records until the NAMESTR header; 64 records is
+            # far more than any real BRFSS XPT needs.
+            pos = 80
+            for _ in range(64):
+                rec = mm[pos:pos + 80]
+                pos += 80
+                if len(rec) < 80:
+                    break
+                if rec.startswith(_MEMBER_MAGIC):
+                    # trailing digits carry the NAMESTR size (140 or 136)
+                    tail = rec[48:].rstrip()
+                    if tail[-3:].isdigit():
+                        namestr_len = int(tail[-3:])
+                elif rec.startswith(_NAMESTR_MAGIC):
+                    n_vars = int(rec[54:58])
+                    break
+            if n_vars is None:
+                return read_xpt_meta_fallback(xpt_path)
+
+            names: List[str] = []
+            labels: List[str] = []
+            value_map: dict = {}
+            for i in range(n_vars):
+                rec = struct.unpack_from(_NAMESTR_PREFIX_FMT, mm, pos + i * namestr_len)
+                name = _decode(rec[4])
+                names.append(name)
+                labels.append(_decode(rec[5]))
+                nform = _decode(rec[6])
+                if nform:
+                    value_map[name] = nform
+
+        return {
+            "column_names": names,
+            "column_labels": labels,
+            "variable_value_labels": value_map,
+        }
+    except Exception:
+        return read_xpt_meta_fallback(xpt_path)
+
+
+# ---------- helpers ----------
+
+def list_xpts() -> List[Tuple[Path, os.stat_result]]:
+    """List brfss_*.xpt files via scandir; the stat result comes for free
+    and feeds the metadata-cache key without another syscall."""
+    if not RAW_XPT_DIR.exists():
+        return []
+    with os.scandir(RAW_XPT_DIR) as it:
+        entries = [
+            e for e in it
+            if e.name.startswith("brfss_") and e.name.endswith(".xpt") and e.is_file()
+        ]
+    entries.sort(key=lambda e: e.name)
+    return [(Path(e.path), e.stat()) for e in entries]
+
+
+def extract_year(p: Path) -> int:
+    return int(_YEAR_RE.search(p.name).group(1))
+
+
+def cache_key(p: Path, st: os.stat_result) -> Tuple[str, int, int]:
+    return (str(p), st.st_mtime_ns, st.st_size)
+
+
+def load_meta_cache() -> dict:
+    try:
+        return pickle.loads(META_CACHE_PATH.read_bytes())
+    except Exception:
+        return {}
+
+
+def save_meta_cache(cache: dict) -> None:
+    # atomic: write to a temp file in the same dir, then rename over
+    fd, tmp = tempfile.mkstemp(dir=OUT_DIR, prefix=".xpt_meta_cache.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, META_CACHE_PATH)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+# ---------- per-file worker ----------
+
+def process_one(p: Path, meta: dict | None = None) -> tuple:
+    """
+    Worker for one XPT: read header metadata (unless a cached dict is
+    supplied), build the per-year columns and serialize the per-year CSV to
+    bytes. File writes happen in the parent so workers never contend on the
+    output directory.
+    """
+    year = extract_year(p)
+    out_csv = OUT_DIR / f"vars_{year}.csv"
+    csv_current = (
+        out_csv.exists() and out_csv.stat().st_mtime_ns >= p.stat().st_mtime_ns
+    )
+    if meta is None and csv_current:
+        # per-year CSV is newer than the XPT: rebuild the metadata from it
+        # instead of touching the XPT at all
+        prev = pacsv.read_csv(out_csv)
+        names = prev["var_name"].to_pylist()
+        labels = [lbl or "" for lbl in prev["var_label"].to_pylist()]
+        tables = [v or "" for v in prev["value_label_table"].to_pylist()]
+        meta = {
+            "column_names": names,
+            "column_labels": labels,
+            "variable_value_labels": {n: v for n, v in zip(names, tables) if v},
+        }
+    if meta is None:
+        meta = read_xpt_meta(p)
+    var_names = meta["column_names"]
+    var_labels = meta["column_labels"]
+    value_map = meta["variable_value_labels"]
+
+    n = len(var_names)
+    vlts = [value_map.get(name, "") for name in var_names]
+    # lowercase here so the work parallelizes with the rest of the scan
+    names_lc = [s.lower() for s in var_names]
+    labels_lc = [lbl.lower() for lbl in var_labels]
+
+    # Arrow table straight from the lists; no pandas materialization.
+    year_tbl = pa.table(
+        {
+            "year": pa.array([year] * n, pa.int16()),
+            "var_name": pa.array(var_names),
+            "var_label": pa.array(var_labels),
+            "value_label_table": pa.array(vlts),
+        }
+    )
+    if csv_current:
+        csv_bytes = None  # on-disk CSV is already up to date
+    else:
+        buf = io.BytesIO()
+        pacsv.write_csv(year_tbl, buf)
+        csv_bytes = buf.getvalue()
+    return year, var_names, var_labels, vlts, names_lc, labels_lc, n, csv_bytes, meta
+
+
+# ---------- main ----------
+
+def main() -> None:
+    xpts = list_xpts()
+    if not xpts:
+        print("No XPT files found in", RAW_XPT_DIR.resolve())
+        print("Run 02_parse_brfss_xpt.py first.")
+        sys.exit(1)
+
+    per_year_counts: dict = {}
+    total = 0
+    writer = None
+
+    # XPT files never change once downloaded, so header metadata can be
+    # reused across runs keyed on (path, mtime, size).
+    meta_cache = load_meta_cache()
+    cached = [meta_cache.get(cache_key(p, st)) for p, st in xpts]
+    paths = [p for p, _ in xpts]
+
+    # Per-file work is independent; processes (not threads) because
+    # pyreadstat/pandas hold the GIL while parsing on the fallback path.
+    # Workers return in year order (xpts is sorted), so appending one
+    # sorted-by-name row group per year preserves the global
+    # (year, var_name_lc) ordering while keeping peak memory at one year.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for (p, st), (year, names, labels, vlts, names_lc, labels_lc, count, csv_bytes, meta) in zip(
+            xpts, ex.map(process_one, paths, cached, chunksize=1)
+        ):
+            meta_cache[cache_key(p, st)] = meta
+            if csv_bytes is not None:
+                out_csv = OUT_DIR / f"vars_{year}.csv"
+                out_csv.write_bytes(csv_bytes)
+            # The same ~300 variable codes repeat across ~20 years; intern
+            # on arrival (worker strings cross a pickle boundary, so this
+            # has to happen parent-side) to hold one str object per code.
+            names = np.array([sys.intern(n) for n in names], object)
+            names_lc = np.array([sys.intern(n) for n in names_lc], object)
+            vlts = np.array([sys.intern(v) for v in vlts], object)
+            labels = np.array(labels, object)
+            labels_lc = np.array(labels_lc, object)
+
+            # Sort this year's rows by lowercase name via one argsort
+            # permutation, skipping the dtype-generic table sort.
+            idx = np.argsort(names_lc, kind="stable")
+            tbl = pa.table(
+                {
+                    "year": pa.array(np.full(count, year, np.int16)),
+                    "var_name": pa.array(names[idx]),
+                    "var_label": pa.array(labels[idx]),
+                    "value_label_table": pa.array(vlts[idx]),
+                    "var_name_lc": pa.array(names_lc[idx]),
+                    "var_label_lc": pa.array(labels_lc[idx]),
+                }
+            )
+            if writer is None:
+                # Dictionary-encode the low-cardinality string columns
+                # (~300 unique names repeated ~20x). zstd everything:
+                # a per-column codec of "none" for the int16 year column
+                # would reject the compression_level and the column is a
+                # few bytes after dictionary/RLE anyway.
+                writer = pq.ParquetWriter(
+                    COMBINED_PATH,
+                    tbl.schema,
+                    compression="zstd",
+                    compression_level=3,
+                    use_dictionary=["var_name", "value_label_table", "var_name_lc"],
+                    data_page_size=256 * 1024,
+                )
+            # one row group per year -> year min/max stats let readers
+            # prune row groups by predicate
+            writer.write_table(tbl)
+
+            per_year_counts[year] = count
+            total += count
+            print(f"{year}: {count} variables")
+
+    if writer is not None:
+        writer.close()
+    save_meta_cache(meta_cache)
+
+    summary = {
+        "files": len(xpts),
+        "variables": total,
+        "per_year_counts": per_year_counts,
+    }
+    if orjson is not None:
+        # OPT_NON_STR_KEYS: per_year_counts is keyed by int years, which
+        # orjson (unlike json) rejects by default
+        SUMMARY_JSON.write_bytes(
+            orjson.dumps(
+                summary, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            )
+        )
+    else:
+        SUMMARY_JSON.write_text(json.dumps(summary, indent=2))
+    print(f"Wrote {COMBINED_PATH} ({total} rows)")
+
+
+if __name__ == "__main__":
+    main()
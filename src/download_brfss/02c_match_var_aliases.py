@@ -0,0 +1,357 @@
+"""
+02c_match_var_aliases.py
+------------------------
+Match seed health/socioeconomic concepts against the combined BRFSS
+variable index (built by 02b_scan_xpt_meta.py) to find which variable
+names and labels carry each concept across survey years. BRFSS renames
+variables between years (EDUCA/EDUCA2, DIABETES/DIABETE3, ...), so the
+output is the starting point for curating the rename maps used in
+03_brfss_batchprocess.
+
+- Reads data/metadata/brfss_var_index.parquet
+- Exact name hits, plus fuzzy name and label scoring via RapidFuzz
+- Writes the concept -> aliases mapping to data/metadata/brfss_alias_map.yaml
+- Writes per-concept coverage stats to data/metadata/brfss_alias_coverage.csv
+
+Usage:
+  python scripts/02c_match_var_aliases.py
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import yaml
+
+try:
+    from yaml import CSafeDumper as _YamlDumper  # libyaml, if compiled in
+except ImportError:
+    from yaml import SafeDumper as _YamlDumper
+try:
+    import polars as pl  # optional: multi-threaded native aggregation
+except ImportError:
+    pl = None
+from rapidfuzz import fuzz, utils
+from rapidfuzz import process as rf_process
+
+META_DIR = Path("data/metadata")
+VAR_INDEX = META_DIR / "brfss_var_index.parquet"
+OUT_YAML = META_DIR / "brfss_alias_map.yaml"
+OUT_CSV = META_DIR / "brfss_alias_coverage.csv"
+
+NAME_SIM_THRESH = 90
+LABEL_SIM_THRESH = 80
+
+# Seed concepts: exact-name aliases we already know about, plus label
+# phrases to catch years where the variable was renamed entirely.
+SEED_CANONICAL: Dict[str, dict] = {
+    "general_health_status": {
+        "aliases_exact": ["genhlth"],
+        "label_terms": ["general health"],
+    },
+    "days_physical_health_not_good": {
+        "aliases_exact": ["physhlth"],
+        "label_terms": ["physical health not good"],
+    },
+    "days_mental_health_not_good": {
+        "aliases_exact": ["menthlth"],
+        "label_terms": ["mental health not good"],
+    },
+    "has_any_health_plan": {
+        "aliases_exact": ["hlthplan", "hlthpln1"],
+        "label_terms": ["health care coverage", "health plan"],
+    },
+    "could_not_see_doctor_due_to_cost": {
+        "aliases_exact": ["medcost"],
+        "label_terms": ["could not see doctor because of cost"],
+    },
+    "time_since_last_checkup": {
+        "aliases_exact": ["checkup", "checkup1"],
+        "label_terms": ["routine checkup"],
+    },
+    "ever_told_high_bp": {
+        "aliases_exact": ["bphigh", "bphigh4"],
+        "label_terms": ["high blood pressure"],
+    },
+    "ever_told_high_cholesterol": {
+        "aliases_exact": ["toldhi", "toldhi2"],
+        "label_terms": ["blood cholesterol high"],
+    },
+    "ever_told_diabetes": {
+        "aliases_exact": ["diabetes", "diabete2", "diabete3"],
+        "label_terms": ["told you have diabetes"],
+    },
+    "smoked_100_cigarettes": {
+        "aliases_exact": ["smoke100"],
+        "label_terms": ["smoked at least 100 cigarettes"],
+    },
+    "current_smoking_frequency": {
+        "aliases_exact": ["smokeday", "smokday2"],
+        "label_terms": ["days now smoking"],
+    },
+    "any_alcohol_past_month": {
+        "aliases_exact": ["drinkany", "alcday4", "alcday5"],
+        "label_terms": ["days had alcoholic beverage", "alcohol"],
+    },
+    "education_level": {
+        "aliases_exact": ["educa"],
+        "label_terms": ["education"],
+    },
+    "employment_status": {
+        "aliases_exact": ["employ", "employ1"],
+        "label_terms": ["employment status"],
+    },
+    "household_income_category": {
+        "aliases_exact": ["income2", "income3"],
+        "label_terms": ["annual household income"],
+    },
+    "marital_status": {
+        "aliases_exact": ["marital"],
+        "label_terms": ["marital status"],
+    },
+    "respondent_sex": {
+        "aliases_exact": ["sex", "sex1"],
+        "label_terms": ["sex of respondent"],
+    },
+    "respondent_age": {
+        "aliases_exact": ["age", "_age80", "_ageg5yr"],
+        "label_terms": ["reported age"],
+    },
+    "final_weight": {
+        "aliases_exact": ["_finalwt", "_llcpwt"],
+        "label_terms": ["final weight"],
+    },
+    "county_code": {
+        "aliases_exact": ["ctycode", "_cnty"],
+        "label_terms": ["county"],
+    },
+}
+
+
+def _stem(name: str) -> str:
+    """Strip leading underscores and trailing version digits
+    (DIABETE3 -> diabete, HLTHPLN1 -> hlthpln, _cnty -> cnty)."""
+    return name.lstrip("_").rstrip("0123456789")
+
+
+def _agg_cache_path() -> Path:
+    """Cache path keyed on the var index's stat, so a rebuilt index
+    invalidates the cache automatically."""
+    st = VAR_INDEX.stat()
+    key = hashlib.md5(f"{st.st_mtime_ns}-{st.st_size}".encode()).hexdigest()[:12]
+    return META_DIR / f".agg_cache_{key}.parquet"
+
+
+def load_agg() -> pd.DataFrame:
+    """
+    One row per distinct (name, label) with the years it appears in.
+    The aggregation is a pure function of the index file, so cache it on
+    disk — repeat runs while tuning SEED_CANONICAL skip the read+groupby.
+    """
+    cache_path = _agg_cache_path()
+    if cache_path.exists():
+        return pd.read_parquet(cache_path)
+
+    if pl is not None:
+        # polars runs the whole group_by in native code across all cores
+        agg = (
+            pl.read_parquet(VAR_INDEX)
+            .group_by(["var_name_lc", "var_label_lc"])
+            .agg(
+                pl.col("year").unique().sort().alias("years"),
+                pl.len().alias("occurrences"),
+            )
+            .to_pandas()
+        )
+    else:
+        df = pd.read_parquet(VAR_INDEX)
+        # arrow-backed strings live in contiguous buffers and groupby
+        # runs arrow-native kernels instead of hashing Python objects
+        df["var_name_lc"] = df["var_name_lc"].astype("string[pyarrow]")
+        df["var_label_lc"] = df["var_label_lc"].astype("string[pyarrow]")
+        # pre-sorting by year makes "unique" (which preserves first-seen
+        # order) emit already-sorted arrays, so no per-group sort pass
+        df = df.sort_values("year", kind="stable")
+        grouped = df.groupby(["var_name_lc", "var_label_lc"], sort=False)["year"]
+        agg = pd.DataFrame(
+            {"years": grouped.unique(), "occurrences": grouped.size()}
+        ).reset_index()
+    agg.to_parquet(cache_path, index=False)
+    return agg
+
+
+def main() -> None:
+    agg = load_agg()
+
+    name_pool: List[str] = agg["var_name_lc"].tolist()
+
+    # Normalize the pools once up front; otherwise RapidFuzz re-runs
+    # default_process over every pool string for every query.
+    name_pool_pp = [utils.default_process(s) for s in name_pool]
+
+    # Normalize and tokenize the labels in one pass. Labels are short
+    # bag-of-words phrases, so an inverted token index narrows each term
+    # to the labels sharing all its tokens before any DP scoring runs;
+    # token_set_ratio then scores only those candidates.
+    label_pool_pp: List[str] = []
+    token_index: Dict[str, set] = defaultdict(set)
+    for i, s in enumerate(agg["var_label_lc"].fillna("")):
+        lbl = utils.default_process(s)
+        label_pool_pp.append(lbl)
+        for tok in lbl.split():
+            token_index[tok].add(i)
+
+    # Batch every query across every concept into two cdist calls so
+    # RapidFuzz's C++ inner loop runs over all (query, pool) pairs at once
+    # instead of one process.extract dispatch per term. Concepts share
+    # terms ("age", "alcohol", EDUCA/EDUCA2 stems), so dedupe the queries
+    # and fan each unique term's hits back out to every owning concept.
+    name_owners: Dict[str, List[str]] = {}
+    label_owners: Dict[str, List[str]] = {}
+    for canon, cfg in SEED_CANONICAL.items():
+        for alias in cfg["aliases_exact"]:
+            name_owners.setdefault(utils.default_process(alias), []).append(canon)
+        for term in cfg["label_terms"]:
+            label_owners.setdefault(utils.default_process(term), []).append(canon)
+    name_queries: List[str] = list(name_owners)
+    label_queries: List[str] = list(label_owners)
+
+    # BRFSS names follow a narrow grammar: letters plus trailing version
+    # digits (DIABETE3, HLTHPLN1). Matching stems exactly via a dict
+    # catches nearly every real rename with O(N) hashing, so the
+    # edit-distance matrix only runs for queries whose stem hits nothing.
+    stem_rows: Dict[str, List[int]] = defaultdict(list)
+    for i, name in enumerate(name_pool_pp):
+        stem_rows[_stem(name)].append(i)
+
+    stem_hits: Dict[str, List[int]] = {}
+    unstemmed_queries: List[str] = []
+    for query in name_queries:
+        rows = stem_rows.get(_stem(query))
+        if rows:
+            stem_hits[query] = rows
+        else:
+            unstemmed_queries.append(query)
+
+    # score_cutoff lets the scorer bail as soon as the partial edit
+    # distance proves the cutoff is unreachable; sub-cutoff cells come
+    # back as 0, so a plain argwhere(scores) yields the passing hits.
+    # uint8 quarters the matrix footprint vs the float32 default, which
+    # keeps the argwhere scan below in cache
+    name_scores = rf_process.cdist(
+        unstemmed_queries, name_pool_pp, scorer=fuzz.ratio,
+        processor=None, workers=-1, score_cutoff=NAME_SIM_THRESH,
+        dtype=np.uint8,
+    )
+
+    hits_by_canon: Dict[str, list] = {canon: [] for canon in SEED_CANONICAL}
+    for query, rows in stem_hits.items():
+        for canon in name_owners[query]:
+            for pi in rows:
+                hits_by_canon[canon].append((pi, "stem_name"))
+    for qi, pi in np.argwhere(name_scores):
+        for canon in name_owners[unstemmed_queries[qi]]:
+            hits_by_canon[canon].append((int(pi), "fuzzy_name"))
+    for query in label_queries:
+        postings = [token_index.get(tok) for tok in query.split()]
+        if not postings or any(p is None for p in postings):
+            continue
+        for i in set.intersection(*postings):
+            if fuzz.token_set_ratio(
+                query, label_pool_pp[i], score_cutoff=LABEL_SIM_THRESH
+            ):
+                for canon in label_owners[query]:
+                    hits_by_canon[canon].append((i, "fuzzy_label"))
+
+    # name -> row positions; one hash lookup per alias instead of a
+    # boolean-mask scan over the whole agg frame
+    by_name = agg.groupby("var_name_lc").indices
+
+    # flat column arrays aligned by row position; hit materialization
+    # indexes these directly with no BlockManager in the loop
+    names_arr = agg["var_name_lc"].to_numpy(object)
+    labels_arr = agg["var_label_lc"].fillna("").to_numpy(object)
+    years_arr = agg["years"].to_numpy(object)
+    occ_arr = agg["occurrences"].to_numpy()
+
+    def process_canon(item: tuple) -> tuple:
+        canon, cfg = item
+        # (1) exact name matches, (2) fuzzy hits from the score matrices
+        idx_list: List[int] = []
+        via_list: List[str] = []
+        for alias in cfg["aliases_exact"]:
+            for i in by_name.get(alias.lower(), ()):
+                idx_list.append(int(i))
+                via_list.append("exact")
+        for i, via in hits_by_canon[canon]:
+            idx_list.append(i)
+            via_list.append(via)
+
+        # dedup as we go: keyed by var_name, first-seen label/via win.
+        # A name can span several agg rows when its label text drifted
+        # between years (the norm in BRFSS), so rows after the first
+        # merge into the record — union years, sum occurrences — instead
+        # of being dropped, while repeat hits on the same row are skipped.
+        aliases: Dict[str, dict] = {}
+        for i, via in zip(idx_list, via_list):
+            name = names_arr[i]
+            rec = aliases.get(name)
+            if rec is not None:
+                if i in rec["_rows"]:
+                    continue
+                rec["_rows"].add(i)
+                rec["years"] = sorted(
+                    set(rec["years"]).union(int(y) for y in years_arr[i])
+                )
+                rec["occurrences"] += int(occ_arr[i])
+                continue
+            aliases[name] = {
+                "var_name": name,
+                "var_label": labels_arr[i],
+                "years": [int(y) for y in years_arr[i]],
+                "occurrences": int(occ_arr[i]),
+                "via": via,
+                "_rows": {i},
+            }
+        dedup = list(aliases.values())
+        for rec in dedup:
+            del rec["_rows"]
+
+        years_covered = sorted({y for a in dedup for y in a["years"]})
+        return canon, dedup, years_covered
+
+    mapping: Dict[str, dict] = {}
+    # stream coverage rows straight to CSV; no DataFrame round-trip
+    cov_fields = ["canonical", "n_aliases", "n_years", "first_year", "last_year"]
+    with OUT_CSV.open("w", newline="") as cov_f:
+        writer = csv.DictWriter(cov_f, fieldnames=cov_fields)
+        writer.writeheader()
+        # all fuzzy scoring is batched into the cdist/token-index passes
+        # above, so what remains per concept is GIL-bound dict work — a
+        # plain loop; a thread pool here would only add overhead
+        for canon, dedup, years_covered in map(process_canon, SEED_CANONICAL.items()):
+            mapping[canon] = {"aliases": dedup}
+            writer.writerow(
+                {
+                    "canonical": canon,
+                    "n_aliases": len(dedup),
+                    "n_years": len(years_covered),
+                    "first_year": years_covered[0] if years_covered else None,
+                    "last_year": years_covered[-1] if years_covered else None,
+                }
+            )
+            print(f"{canon}: {len(dedup)} aliases, {len(years_covered)} years")
+
+    with OUT_YAML.open("w", buffering=1 << 20) as f:
+        yaml.dump(mapping, f, Dumper=_YamlDumper, sort_keys=False)
+    print(f"Wrote {OUT_YAML} and {OUT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+_zip_xpt.py
+-----------
+Shared helpers for the BRFSS ZIP/XPT scripts (02_parse_brfss_xpt.py,
+02a_extract_xpts.py): locating the ZIP for a survey year, streaming the
+XPT entry out of it, robust XPT -> DataFrame parsing, and the minimal
+per-year normalization. One canonical copy here means every fix or
+speedup lands in both scripts at once instead of drifting across
+copy-pasted versions.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+ZIPS_DIR = Path("data/raw/brfss_zips")
+OUT_DIR  = Path("data/raw/brfss_year")
+RAW_XPT_DIR = OUT_DIR / "raw_xpt"
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+RAW_XPT_DIR.mkdir(parents=True, exist_ok=True)
+
+
+@lru_cache(maxsize=1)
+def _list_zip_candidates() -> tuple:
+    """
+    (lowercased name, path) for every ZIP in ZIPS_DIR. Cached so a
+    multi-year run lists the directory once instead of once per year.
+    """
+    if not ZIPS_DIR.exists():
+        return ()
+    return tuple(
+        (p.name.lower(), p)
+        for p in ZIPS_DIR.iterdir()
+        if p.is_file() and p.name.lower().endswith((".zip", ".zipx"))
+    )
+
+
+def find_zip_for_year(year: int) -> Optional[Path]:
+    """
+    Find a ZIP in ZIPS_DIR for the given year, case-insensitively.
+    Accepts names like CDBRFS00XPT.ZIP, LLCP2019XPT.zip, etc.
+    Prefers files whose name contains both the year fragment and 'xpt'.
+    """
+    y2, y4 = f"{year%100:02d}", str(year)
+
+    cands = [
+        (name, p) for name, p in _list_zip_candidates()
+        if y2 in name or y4 in name
+    ]
+    if not cands:
+        return None
+
+    # prefer ones that also include 'xpt' in the filename
+    with_xpt = [t for t in cands if "xpt" in t[0]]
+    if with_xpt:
+        cands = with_xpt
+
+    # deterministic: sort by name and pick the first
+    cands.sort(key=lambda t: t[0])
+    return cands[0][1]
+
+
+def extract_xpt_to(zip_path: Path, out_path: Path) -> bool:
+    """
+    Stream the first *.xpt entry in the ZIP (case-insensitive, tolerating
+    entries with trailing spaces like 'LLCP2019.XPT ') to out_path with a
+    1 MiB buffer, so peak memory stays O(buffer) rather than the size of
+    the decompressed XPT. Returns True if an XPT was found and written.
+    """
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            # BRFSS ZIPs hold exactly one XPT plus metadata files; match
+            # against the already-parsed central directory in one pass
+            matches = [
+                n for n in zf.namelist()
+                if n.strip().lower().endswith(".xpt")
+            ]
+            if not matches:
+                return False
+            # 1 MiB buffers on both ends: the default 8 KiB write
+            # buffer tanks throughput on network filesystems
+            with zf.open(matches[0]) as src, \
+                    open(out_path, "wb", buffering=1 << 20) as dst:
+                shutil.copyfileobj(
+                    io.BufferedReader(src, buffer_size=1 << 20),
+                    dst, length=1 << 20,
+                )
+            return True
+    except Exception as e:
+        raise RuntimeError(f"Error reading ZIP {zip_path.name}: {e}")
+
+
+def read_xpt_robust(xpt_path: Path, columns: Optional[list] = None) -> pd.DataFrame:
+    """
+    Try pyreadstat, else pandas.read_sas(format='xport').
+    Reads from disk — pyreadstat's C reader is faster on a real file than
+    on a BytesIO and nothing holds a second copy of the file in memory.
+    With `columns`, only those variables are decoded (pyreadstat usecols);
+    for a typical 20-of-330 subset that skips ~90% of the decode work.
+    Returns a pandas DataFrame or raises RuntimeError.
+
+    Reads single-threaded: read_file_multiprocessing needs a row count
+    up front, which XPORT metadata doesn't carry (meta.number_rows is
+    None), so the parallel decode isn't available for this format —
+    per-year parallelism comes from the process pool in the caller.
+    """
+    try:
+        import pyreadstat
+    except ImportError:
+        pyreadstat = None
+
+    if pyreadstat is not None:
+        # Only ReadstatError is treated as "this file needs the fallback";
+        # anything else (MemoryError, OSError, truncation mid-read) is a
+        # real problem that retrying with a 20x slower parser would only
+        # compound, so it propagates. That includes a TypeError from
+        # usecols on a pyreadstat too old to know it: silently retrying
+        # without it would hand back the full decode the caller asked
+        # to avoid.
+        try:
+            if columns:
+                df, _ = pyreadstat.read_xport(
+                    str(xpt_path), usecols=list(columns)
+                )
+            else:
+                df, _ = pyreadstat.read_xport(str(xpt_path))
+            return df
+        except pyreadstat.ReadstatError as e:
+            if not os.environ.get("BRFSS_ALLOW_PANDAS_SAS"):
+                raise RuntimeError(
+                    f"pyreadstat failed on {xpt_path.name}: {e} "
+                    "(set BRFSS_ALLOW_PANDAS_SAS=1 to allow the pandas fallback)"
+                )
+
+    # opt-in fallback: pandas.read_sas is much slower and silently
+    # retrying it used to mask real pyreadstat errors
+    if os.environ.get("BRFSS_ALLOW_PANDAS_SAS"):
+        df = pd.read_sas(xpt_path, format="xport")
+        if columns:
+            wanted = set(columns)
+            df = df[[c for c in df.columns if c in wanted]]
+        return df
+
+    raise RuntimeError(
+        f"pyreadstat is unavailable for {xpt_path.name}; install it or set "
+        "BRFSS_ALLOW_PANDAS_SAS=1 to allow the slow pandas fallback"
+    )
+
+
+def _zfill_codes(s: pd.Series, width: int) -> np.ndarray:
+    """
+    Zero-padded string codes from a numeric column (1.0 -> '01') in a
+    couple of C-level numpy passes; missing values become ''. The old
+    to_numeric -> Int64 -> string -> str.zfill chain walked the column
+    four times through object/extension dtypes.
+    """
+    num = pd.to_numeric(s, errors="coerce")
+    mask = num.isna().to_numpy()
+    vals = num.to_numpy(dtype="float64", na_value=0).astype("int64")
+    # cast to a dtype wide enough for any int64 before padding: an
+    # astype(f"U{width}") would silently truncate codes longer than
+    # `width` (123 -> '12'), whereas zfill leaves them intact and
+    # visibly malformed
+    out = np.char.zfill(vals.astype("U20"), width)
+    out[mask] = ""
+    return out
+
+
+def normalize_inplace(df: pd.DataFrame, year: int) -> pd.DataFrame:
+    """
+    Minimal normalization, mutating `df` in place (the caller owns the
+    only reference, so copying the multi-GB frame first just doubled
+    peak memory):
+      - lowercase all column names
+      - add `year`
+      - downcast float64 code columns to the narrowest numeric dtype
+      - if _STATE/_CNTY exist, create `state_fips` (2-digit) and `fips` (5-digit)
+    """
+    df.columns = [c.strip().lower() for c in df.columns]
+    df["year"] = year
+
+    # pyreadstat hands every numeric column back as float64, but most
+    # BRFSS variables are small integer codes (1-9, 88, 99); narrower
+    # types compress multiplicatively better in Parquet and halve the
+    # bytes pushed through the writer
+    for c in df.columns:
+        if pd.api.types.is_float_dtype(df[c]):
+            integral = df[c].dropna().mod(1).eq(0).all()
+            if not integral:
+                df[c] = pd.to_numeric(df[c], downcast="float")
+            elif df[c].isna().any():
+                # to_numeric cannot downcast a float column through NaN
+                # (it hands back float64 unchanged), which is exactly the
+                # shape of most BRFSS code columns; go through nullable
+                # Int64 first, then shrink to the narrowest Int type
+                df[c] = pd.to_numeric(df[c].astype("Int64"), downcast="integer")
+            else:
+                df[c] = pd.to_numeric(df[c], downcast="integer")
+
+    # _STATE and _CNTY variable names are uppercase in many BRFSS years.
+    # The derived codes have ~50 / ~3000 uniques over 400k rows, so store
+    # them categorical: one object per distinct value instead of per row,
+    # and pyarrow turns them into DICTIONARY-encoded Parquet columns.
+    if "_state" in df.columns:
+        state_codes = _zfill_codes(df["_state"], 2)
+        df["state_fips"] = pd.Categorical(state_codes)
+
+    if "_cnty" in df.columns:
+        cnty_codes = _zfill_codes(df["_cnty"], 3)
+        df["county_fips3"] = pd.Categorical(cnty_codes)
+        if "state_fips" in df.columns:
+            # one C-level concat of the fixed-width code arrays; missing
+            # codes are already '', so no fillna pass is needed
+            df["fips"] = pd.Categorical(np.char.add(state_codes, cnty_codes))
+
+    return df
@@ -0,0 +1,983 @@
+"""
+brfss_batchprocess.py
+---------------------
+Split the per-year BRFSS files written by 02_parse_brfss_xpt.py
+(Parquet by default, CSV from --emit-csv runs) into
+four thematic outputs per year — socioeconomic and health, core and
+expanded — with county FIPS built from _state/ctycode and county/state
+names merged in from county_fips_crosswalk.csv (01_build_county_crosswalk).
+By default the themed slices land in a single Parquet dataset under
+processed/brfss/ partitioned by survey_year and theme;
+output_format="parquet" or "csv" keeps the legacy flat per-year files.
+Driven by 03_brfss_batchprocess.ipynb; importable for scripted runs.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+try:
+    # optional fast path: the lazy engine fuses scan + filter + projection
+    # and each sink only reads the columns it needs from the CSV
+    import polars as pl
+except ImportError:
+    pl = None
+
+# Copy-on-write: selections and filters below share data until written
+# to, so the defensive .copy() calls (which duplicated the year's frame
+# four times over) are no longer needed
+pd.set_option("mode.copy_on_write", True)
+
+RAW_DIR = "data/raw/brfss_year/"
+OUT_DIR = "processed/"
+# default layout: one Parquet dataset partitioned by survey_year/theme
+# instead of 4xN flat files — readers of a single theme and year get
+# partition and column pruning for free, and the geo columns are no
+# longer duplicated across four files per year on every scan
+DATASET_DIR = os.path.join(OUT_DIR, "brfss")
+
+# 1993-2010 mapping dictionaries
+
+job_a_map = {
+    # --- Survey design & metadata ---
+    "_state": "state_fips_code",
+    "_geostr": "geographic_stratum",
+    "_denstr": "density_stratum",
+    "_psu": "primary_sampling_unit",
+    "_record": "record_type",
+    "idate": "interview_date",
+    "imonth": "interview_month",
+    "iday": "interview_day",
+    "iyear": "interview_year",
+    "intvid": "interviewer_id",
+    "dispcode": "disposition_code",
+    "winddown": "winddown_flag",
+    "seqno": "sequence_number",
+    "nattmpts": "attempts_at_contact",
+    "nrecsel": "record_selection_number",
+    "nrecstr": "record_stratum_number",
+    "bpselwt": "bp_selection_weight",
+    "wakss1s2": "wakss_stage_variable",
+
+    # --- Household composition ---
+    "numadult": "num_adults_in_household",
+    "nummen": "num_men_in_household",
+    "numwomen": "num_women_in_household",
+
+    # --- General health ---
+    "genhlth": "general_health_status",
+    "physhlth": "days_physical_health_not_good",
+    "menthlth": "days_mental_health_not_good",
+    "poorhlth": "days_poor_health_limited_activities",
+
+    # --- Insurance / coverage ---
+    "hlthplan": "has_any_health_plan",
+    "medicar2": "covered_by_medicare",
+    "typcovr1": "coverage_type_primary",
+    "typcovr2": "coverage_type_secondary",
+    "nocov12": "no_health_coverage_12mo",
+    "pastplan": "had_previous_plan",
+    "medcost": "could_not_see_doctor_due_to_cost",
+    "checkup": "time_since_last_checkup",
+
+    # --- Blood pressure / cholesterol ---
+    "bptake": "blood_pressure_taken",
+    "bphigh": "ever_told_high_bp",
+    "highgt1": "told_high_bp_more_than_once",
+    "bloodcho": "ever_had_cholesterol_checked",
+    "cholchk": "cholesterol_checked_5yr",
+    "toldhi": "ever_told_high_cholesterol",
+    "diabetes": "ever_told_diabetes",
+
+    # --- Dental / oral health ---
+    "lastden2": "last_dentist_visit",
+    "rmvteeth": "teeth_removed_due_to_decay",
+    "denclean": "teeth_cleaned_by_dentist",
+
+    # --- Skin cancer / sun ---
+    "sunburn": "sunburn_past_year",
+    "numburn": "num_sunburns_past_year",
+
+    # --- Tobacco (beginning) ---
+    "smoke100": "smoked_100_cigarettes",
+    "smokeday": "current_smoking_frequency",
+    "smokenum": "cigs_smoked_per_day",
+    "smoknm30": "cigs_smoked_past_30d",
+    "stopsmok": "ever_attempted_quit_smoking",
+    "lastsmok": "time_since_last_smoked",
+
+    # --- Alcohol use ---
+    "drinkany": "any_alcohol_past_month",
+    "alcohol": "avg_drinks_per_week",
+    "nalcocc": "num_alcoholic_occasion",
+    "drinkge5": "binge_drinking_occurrence",
+    "drinkdri": "drank_and_drove",
+
+    # --- Core demographics ---
+    "age": "respondent_age",
+    "orace": "respondent_race",
+    "hispanic": "hispanic_ethnicity",
+    "marital": "marital_status",
+    "chld04": "children_under_5_in_household",
+    "chld0512": "children_5_12_in_household",
+    "chld1317": "children_13_17_in_household",
+    "educa": "education_level",
+    "employ": "employment_status",
+    "income2": "household_income_category",
+    "weight": "respondent_weight_pounds",
+    "height": "respondent_height_inches",
+    "htf": "height_feet",
+    "hti": "height_inches_remainder",
+    "ctycode": "county_code",
+    "numhhold": "num_households",
+    "numphons": "num_phones",
+    "sex": "respondent_sex",
+}
+
+job_b_map = {
+    # --- Cancer screenings & reproductive health ---
+    "hadmam": "ever_had_mammogram",
+    "howlong": "time_since_last_mammogram",
+    "whydone": "reason_for_last_mammogram",
+    "profexam": "ever_had_clinical_breast_exam",
+    "lengexam": "time_since_last_clinical_breast_exam",
+    "reasexam": "reason_for_last_clinical_breast_exam",
+    "hadpap": "ever_had_pap_smear",
+    "lastpap": "time_since_last_pap_smear",
+    "whypap": "reason_for_last_pap_smear",
+    "hadhyst": "ever_had_hysterectomy",
+    "pregnant": "currently_pregnant",
+
+    # --- Vaccinations ---
+    "flushot": "flu_shot_past_year",
+    "fluprov": "where_received_flu_shot",
+    "pneumvac": "ever_had_pneumonia_vaccine",
+
+    # --- Cancer screening (colorectal) ---
+    "bldstool": "ever_had_blood_stool_test",
+    "lstbldst": "time_since_last_blood_stool_test",
+    "hadsigm": "ever_had_sigmoidoscopy_colonoscopy",
+    "lastsigm": "time_since_last_sigmoidoscopy",
+
+    # --- Reproductive / household children ---
+    "chldlt16": "children_lt16_in_household",
+
+    # --- Safety / helmets ---
+    "bikehlmt": "wears_bike_helmet",
+
+    # --- Smoking detection proxies ---
+    "smkdete2": "smoke_detector_present",
+
+    # --- Education proxy ---
+    "grade2": "highest_grade_completed",
+
+    # --- HIV / STD testing & risk ---
+    "conduse": "condom_use",
+    "gethiv": "ever_tested_hiv",
+    "donbld85": "donated_blood_since_1985",
+    "don12mo": "donated_blood_past_12mo",
+    "hivtst2a": "ever_tested_hiv2",
+    "hivtst2b": "tested_hiv_in_past_12mo",
+    "hiv12mo": "tested_hiv_last_12mo",
+    "test12mo": "other_test_past_12mo",
+    "rsntst2": "reason_not_tested_hiv",
+    "whrtst3": "where_tested_hiv",
+    "results": "received_hiv_test_results",
+    "counsel": "received_hiv_counseling",
+
+    # --- Diabetes management ---
+    "diabage": "age_told_diabetes",
+    "insulin": "currently_use_insulin",
+    "inslnfrq": "insulin_frequency",
+    "bldsugar": "blood_sugar_test_frequency",
+    "hemoglbn": "ever_tested_hemoglobin_a1c",
+    "doctdiab": "doctor_visits_for_diabetes",
+    "chkhemo": "hemoglobin_a1c_check_frequency",
+    "feetchk": "feet_check_frequency",
+    "eyeexam": "last_eye_exam",
+    "visndist": "trouble_seeing_distance",
+    "visnread": "trouble_reading_print",
+    "visiontv": "trouble_seeing_tv",
+
+    # --- Sexual behavior / risk ---
+    "sexintmn": "sex_partners_past_months",
+    "sexcondm": "condom_use_last_intercourse",
+    "condlast": "time_since_last_condom_use",
+    "coneff2": "condom_effectiveness_perception",
+    "newpartn": "num_new_sex_partners",
+    "hivrisk": "perceived_hiv_risk",
+    "stdtreat": "treated_for_std",
+    "stdclin": "visited_std_clinic",
+    "sexbeha2": "high_risk_sex_behavior",
+    "selcptn3": "contraception_selection",
+    "sex1ptn3": "num_sex_partners_lifetime",
+    "usecond3": "uses_condom_regularly",
+
+    # --- Pregnancy history ---
+    "preglst5": "pregnancies_last_5yrs",
+    "lstpreg": "time_since_last_pregnancy",
+    "lstpreg2": "age_last_pregnancy",
+
+    # --- Birth control ---
+    "brthcntl": "currently_using_birth_control",
+    "typcntrl": "type_of_birth_control",
+    "rsnnobc": "reason_not_using_birth_control",
+
+    # --- Family planning & services ---
+    "whrsvcs": "where_family_planning_services",
+    "famplan": "ever_used_family_planning",
+    "lastused": "time_since_last_birth_control_use",
+    "rsnnocov": "reason_no_health_coverage",
+    "mcrelngt": "length_time_on_medicare",
+    "doctlist": "doctor_provided_list",
+    "certdoct": "certified_doctor_visit",
+    "hlthcovr": "other_health_coverage",
+    "rsnwocov": "reason_without_coverage",
+
+    # --- Care quality ---
+    "ratecare": "rate_healthcare_quality",
+    "primcare": "has_primary_care_provider",
+    "noprimcr": "reason_no_primary_care",
+    "mostcare": "where_usually_seek_care",
+    "facilit2": "type_of_health_facility",
+    "distcare": "distance_to_care_facility",
+    "numbdoc2": "num_doctors_seen",
+    "chngdoct": "changed_doctor_recently",
+    "lastchng": "time_since_doctor_change",
+
+    # --- Chronic conditions ---
+    "asthma": "ever_told_asthma",
+    "asthnow": "currently_has_asthma",
+    "pcseathb": "provider_counseled_eating_habits",
+    "pcsexer": "provider_counseled_exercise",
+    "pcsinjpv": "provider_counseled_injury_prevention",
+    "pcsdrgab": "provider_counseled_drug_abuse",
+    "pcsalch": "provider_counseled_alcohol",
+    "pcssmok": "provider_counseled_smoking",
+    "pcsaids": "provider_counseled_hiv_aids",
+    "cvdfatrk": "cvd_risk_factors_tracked",
+    "cvdexrsk": "cvd_exercise_risk",
+    "cvdfat02": "cvd_fat_risk",
+    "cvdexr02": "cvd_exercise_risk2",
+    "cvdinfar": "ever_told_heart_attack",
+    "cvdcorhd": "ever_told_coronary_heart_disease",
+    "cvdstrok": "ever_told_stroke",
+    "cvdasprn": "takes_daily_aspirin",
+    "aspunsaf": "advised_aspirin_unsafe",
+    "whyaspan": "reason_takes_aspirin",
+    "whyaspha": "reason_take_aspirin_heart",
+    "whyaspsk": "reason_skip_aspirin",
+    "pastmeno": "post_menopausal",
+    "dicsestr": "discussed_estrogen_use",
+    "estrpill": "ever_used_estrogen_pills",
+    "curestro": "estrogen_use_for_condition",
+    "estrhart": "estrogen_use_for_heart",
+    "estrbone": "estrogen_use_for_bone",
+    "estrflsh": "estrogen_use_for_hot_flashes",
+    "pain12mn": "chronic_pain_12mo",
+    "symtmmth": "symptoms_past_month",
+    "lmtjoint": "limited_by_joint_symptoms",
+    "havarth": "ever_told_arthritis",
+    "typearth": "type_of_arthritis",
+    "trtarth": "treatment_for_arthritis",
+}
+
+job_c_map = {
+    # --- Nutrition ---
+    "fruitjui": "drinks_fruit_juice",
+    "fruit": "eats_fruit",
+    "greensal": "eats_green_salad",
+    "potatoes": "eats_potatoes",
+    "carrots": "eats_carrots",
+    "vegetabl": "eats_other_vegetables",
+
+    # --- Physical activity ---
+    "exerany": "any_physical_activity",
+    "exeract1": "primary_exercise_activity",
+    "exeroft1": "frequency_primary_exercise",
+    "exerhmm1": "duration_primary_exercise_minutes",
+    "exeroth2": "did_other_exercise",
+    "exeract2": "secondary_exercise_activity",
+    "exeroft2": "frequency_secondary_exercise",
+    "exerhmm2": "duration_secondary_exercise_minutes",
+    "exerdis1": "distance_primary_exercise",
+    "exerdis2": "distance_secondary_exercise",
+    "phyact": "general_physical_activity_level",
+
+    # --- Weight management ---
+    "losewt": "trying_to_lose_weight",
+    "maintain": "trying_to_maintain_weight",
+    "fewcal": "trying_to_reduce_calories",
+    "wtdesire": "desired_weight_pounds",
+
+    # --- Provider advice ---
+    "dradvice": "received_weight_advice_from_provider",
+
+    # --- Supplements / vitamins ---
+    "vitamins": "takes_vitamins",
+    "multivit": "takes_multivitamins",
+    "folicacd": "takes_folic_acid",
+    "takevit": "times_per_week_takes_vitamins",
+    "recommen": "provider_recommended_vitamins",
+
+    # --- Sun protection behaviors ---
+    "sunblock": "uses_sunblock",
+    "spfnum": "sunblock_spf_number",
+    "avoidsun": "avoids_sun_exposure",
+    "sunhat": "wears_sun_hat",
+    "sunwear": "wears_protective_clothing",
+    "sunsens": "skin_sensitivity_to_sun",
+    "burntype": "typical_sunburn_severity",
+    "howsafe": "perception_of_sun_safety",
+
+    # --- Housing & SES-adjacent ---
+    "renthome": "housing_tenure_rent_vs_own",
+    "curadrs": "current_address_status",
+    "nmclsfrd": "num_close_friends",
+    "enghfood": "food_security",
+
+    # --- Tobacco environment ---
+    "tobacco": "tobacco_in_home",
+    "indoors": "smoking_allowed_indoors",
+    "smkpublc": "smoking_allowed_public_places",
+    "smkwork": "smoking_allowed_workplace",
+    "smkrest": "smoking_allowed_restaurants",
+    "smkschls": "smoking_allowed_schools",
+    "smkdaycr": "smoking_allowed_daycare",
+    "smkindor": "smoking_allowed_indoor_places",
+
+    # --- Smokeless tobacco & current use ---
+    "useever": "ever_used_smokeless_tobacco",
+    "usenow": "currently_uses_smokeless_tobacco",
+
+    # --- Disability ---
+    "disablty": "any_activity_limiting_disability",
+}
+
+job_d_map = {
+    # --- Derived anthropometrics ---
+    "_bmi": "body_mass_index",
+    "_wtforht": "weight_for_height",
+    "weight": "respondent_weight_pounds",   # already in Job A but keep consistent
+    "height": "respondent_height_inches",
+    "htf": "height_feet",
+    "hti": "height_inches_remainder",
+
+    # --- Smoking recodes ---
+    "_smoker2": "smoking_status_recode",
+    "_smkless": "smokeless_tobacco_use_recode",
+    "_rfsmok2": "current_smoker_flag",
+    "_rftobac": "tobacco_use_flag",
+
+    # --- Drinking recodes ---
+    "_drnkmo": "monthly_drinks_estimate",
+    "_rfdracu": "acute_drinking_risk_flag",
+    "_rfdrdri": "drinking_and_driving_flag",
+    "_rfdrchr": "chronic_drinking_risk_flag",
+
+    # --- Fruit & vegetable indices ---
+    "_frtserv": "daily_fruit_veg_servings",
+    "_frtindx": "fruit_veg_index",
+    "_rfregul": "regular_exercise_flag",
+    "_rflifes": "lifestyle_activity_flag",
+
+    # --- Hypertension & cholesterol recodes ---
+    "_rfhype2": "high_blood_pressure_flag",
+    "_rfchol": "high_cholesterol_flag" if "_rfchol" in ["_cholchk"] else None,
+    "_cholchk": "cholesterol_screening_flag",
+
+    # --- Obesity flags ---
+    "_rfobese": "obesity_flag",
+    "_rfwhbmi": "overweight_or_obese_flag",
+
+    # --- Demographic recodes ---
+    "_ageg": "age_category",
+    "_ageg5yr": "age_group_5yr",
+    "_age65yr": "age65plus_flag",
+    "_raceg": "race_group",
+    "_racegr": "race_group_recode",
+    "_raceg2_": "race_group_alt",
+    "_sexg_": "sex_group",
+    "_impage": "imputed_age",
+    "race": "self_reported_race",
+
+    # --- Region & geography ---
+    "_region": "census_region",
+    "_geowt": "geographic_weight",
+    "_msacode": "msa_code",
+    "_ststr": "stratum_code",
+    "_denwt": "density_weight",
+    "_geostr": "geographic_stratum",  # already in Job A but consistent
+    "state_fips": "state_fips_duplicate",  # alt coding
+    "fips": "county_fips_code",
+    "state_name": "state_name",
+    "county_name": "county_name",
+
+    # --- Final weights ---
+    "_raw": "raw_weight",
+    "_csa": "csa_weight",
+    "_wt1": "interim_weight",
+    "_poststr": "post_stratification_weight",
+    "_finalwt": "final_weight",
+    "year": "survey_year",
+    "_qstver": "questionnaire_version",
+    "_totindx": "total_index_score",
+}
+
+# One merged rename mapping, built at import instead of four dict
+# .update() calls on every process_brfss invocation
+COLUMN_MAP = {**job_a_map, **job_b_map, **job_c_map, **job_d_map}
+
+# Only these columns are ever used downstream; typing them as string
+# up front skips Arrow's type inference on the 100+ unused columns
+WANTED = frozenset(COLUMN_MAP) | {"_state", "ctycode"}
+
+# Thematic column lists, defined once at import instead of being
+# re-allocated inside every per-year call.
+
+# --- Geography keys (always included for LAUS crosswalk) ---
+GEO_COLS = ("county_name", "state_name", "survey_year", "final_weight")
+
+# --- Core Socioeconomic variables (no geo) ---
+SOCIO_CORE = (
+    "respondent_age", "respondent_sex", "self_reported_race", "hispanic_ethnicity",
+    "marital_status", "education_level", "employment_status", "household_income_category",
+    "num_adults_in_household", "num_men_in_household", "num_women_in_household",
+    "housing_tenure_rent_vs_own", "food_security",
+    "has_any_health_plan", "covered_by_medicare", "could_not_see_doctor_due_to_cost",
+)
+
+# --- Core Health Outcomes (no geo) ---
+HEALTH_CORE = (
+    "general_health_status", "days_physical_health_not_good", "days_mental_health_not_good",
+    "days_poor_health_limited_activities",
+    "ever_told_high_bp", "ever_told_diabetes",
+    "smoked_100_cigarettes", "current_smoking_frequency",
+    "any_alcohol_past_month", "avg_drinks_per_week",
+    "body_mass_index", "respondent_weight_pounds", "respondent_height_inches",
+    "eats_fruit", "eats_other_vegetables", "any_physical_activity"
+)
+
+# --- Expanded (add to the core vars only) ---
+SOCIO_EXP = SOCIO_CORE + (
+    "county_code", "num_households", "num_phones",
+    "ever_used_family_planning", "length_time_on_medicare",
+    "coverage_type_primary", "coverage_type_secondary", "no_health_coverage_12mo",
+    "had_previous_plan", "reason_without_coverage",
+    "age_category", "age_group_5yr", "age65plus_flag",
+)
+
+HEALTH_EXP = HEALTH_CORE + (
+    "cholesterol_checked_5yr", "ever_told_high_cholesterol",
+    "ever_told_asthma", "currently_has_asthma",
+    "ever_told_heart_attack", "ever_told_coronary_heart_disease",
+    "ever_told_stroke", "ever_told_arthritis",
+    "flu_shot_past_year", "ever_had_sigmoidoscopy_colonoscopy",
+    "ever_had_mammogram", "ever_had_pap_smear",
+    "teeth_cleaned_by_dentist", "last_dentist_visit",
+    "high_blood_pressure_flag", "obesity_flag", "overweight_or_obese_flag",
+    "smoking_status_recode", "tobacco_use_flag"
+)
+
+# Columns with at most ~100 distinct values (geo keys plus the coded
+# survey fields). Stored as pandas categories they reach Parquet as
+# dictionary pages — a fraction of the plain-string size — and read
+# back as Arrow dictionary columns, so downstream groupbys and joins
+# work on integer codes instead of strings.
+LOW_CARD = frozenset({
+    "survey_year", "state_name", "county_name", "county_fips_code",
+    "county_code", "respondent_sex", "marital_status", "employment_status",
+    "education_level", "household_income_category", "self_reported_race",
+    "hispanic_ethnicity", "general_health_status",
+})
+
+
+# brfss_<year>.parquet is what 02_parse_brfss_xpt.py writes by default;
+# brfss_<year>.csv covers --emit-csv runs and pre-existing exports
+_YEAR_FILE_RE = re.compile(r"brfss_(\d{4})\.(parquet|csv)$")
+
+
+def list_year_files():
+    """
+    Sorted per-year BRFSS files in RAW_DIR, one per year: the Parquet
+    written by 02_parse_brfss_xpt.py when present, else that year's CSV.
+    """
+    by_year = {}
+    for f in glob.glob(os.path.join(RAW_DIR, "brfss_*")):
+        m = _YEAR_FILE_RE.search(f)
+        if not m:
+            continue
+        year, ext = m.groups()
+        if ext == "parquet" or year not in by_year:
+            by_year[year] = f
+    return [by_year[y] for y in sorted(by_year)]
+
+
+@lru_cache(maxsize=None)
+def _keep_for_header(names):
+    """
+    Columns to read for a given header signature. Many BRFSS years share
+    an identical header, so the intersection with WANTED runs once per
+    distinct schema shape instead of once per file.
+    """
+    return tuple(c for c in names if c in WANTED)
+
+
+def _present(cols, header_set):
+    """The columns of `cols`, in order, that exist in `header_set`."""
+    return tuple(c for c in cols if c in header_set)
+
+
+@lru_cache(maxsize=1)
+def _load_crosswalk():
+    """
+    The county FIPS crosswalk as an Arrow table, read once per process.
+    A single process_brfss call only needs it once, but repeated calls
+    (notebook reruns, tests) were re-parsing the CSV every time.
+    """
+    return pacsv.read_csv(
+        "county_fips_crosswalk.csv",
+        convert_options=pacsv.ConvertOptions(
+            column_types={
+                "fips": pa.string(),
+                "county_name": pa.string(),
+                "state_name": pa.string(),
+            },
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def _crosswalk_gather_arrays():
+    """
+    fips index plus numpy name arrays for vectorized lookups, built once
+    per process from the cached crosswalk table.
+    """
+    cw = _load_crosswalk().to_pandas().drop_duplicates("fips").set_index("fips")
+    return cw.index, cw["county_name"].to_numpy(), cw["state_name"].to_numpy()
+
+
+def _process_one_year_polars(task, verbose=False):
+    """
+    Lazy-query version of the per-year pipeline: one scan_csv feeds four
+    sink_parquet plans, each of which pushes its own projection down to
+    the CSV scan, so read -> FIPS extraction -> filter -> join -> rename
+    -> write runs streaming and in parallel without materializing the
+    year in memory.
+    """
+    year, fpath = task
+    if verbose:
+        print(f"\nProcessing year {year} (polars): {fpath}")
+
+    lf = pl.scan_csv(fpath, infer_schema_length=0)  # everything as string
+    keep = list(_keep_for_header(tuple(lf.collect_schema().names())))
+    lf = (
+        lf.select(keep)
+        .with_columns(
+            pl.col("_state").str.extract(r"(\d+)", 1).fill_null("").str.zfill(2),
+            pl.col("ctycode").str.extract(r"(\d+)", 1).fill_null("").str.zfill(3),
+        )
+        .filter(pl.col("ctycode") != "000")
+        .with_columns((pl.col("_state") + pl.col("ctycode")).alias("fips"))
+        .join(
+            pl.scan_csv("county_fips_crosswalk.csv", infer_schema_length=0)
+            .select("fips", "county_name", "state_name")
+            .unique(subset="fips", keep="first"),
+            on="fips", how="left",
+        )
+    )
+
+    present = set(keep) | {"fips"}
+    rename_map = {
+        k: v for k, v in COLUMN_MAP.items()
+        if v and k != v and k in present
+    }
+    lf = lf.rename(rename_map)
+
+    out_names = set(lf.collect_schema().names())
+    outputs = [
+        (SOCIO_CORE, f"full_brfss_{year}_socioeconomics_core"),
+        (HEALTH_CORE, f"full_brfss_{year}_health_core"),
+        (SOCIO_EXP, f"full_brfss_{year}_socioeconomics_expanded"),
+        (HEALTH_EXP, f"full_brfss_{year}_health_expanded"),
+    ]
+    for var_list, stem in outputs:
+        cols = list(_present(GEO_COLS + var_list, out_names))
+        lf.select(cols).sink_parquet(
+            os.path.join(OUT_DIR, stem + ".parquet"), compression="zstd",
+        )
+
+    print("Saved 4 BRFSS outputs in:", os.path.abspath(OUT_DIR))
+    for _, stem in outputs:
+        print(f"   - {stem}.parquet")
+    return year
+
+
+def _read_year_table(fpath):
+    """
+    One year's file as an all-string Arrow table of the used columns,
+    whether 02 wrote Parquet (its default) or CSV (--emit-csv).
+    """
+    if fpath.endswith(".parquet"):
+        keep = list(_keep_for_header(tuple(pq.read_schema(fpath).names)))
+        table = pq.read_table(fpath, columns=keep)
+        # the Parquet route carries typed columns; cast them to string so
+        # the downstream regex/pad kernels see the same shape as CSV input
+        return pa.table(
+            {c: pc.cast(table[c], pa.string()) for c in table.column_names}
+        )
+
+    # Sniff the header with a tiny block so the real read can project
+    # to just the used columns — BRFSS years carry hundreds of
+    # columns and the pipeline touches ~40 of them
+    sniff = pacsv.open_csv(
+        fpath, read_options=pacsv.ReadOptions(block_size=1 << 16)
+    )
+    keep = list(_keep_for_header(tuple(sniff.schema.names)))
+
+    # Load the data with Arrow's multithreaded CSV parser (several
+    # times faster than pandas' and a fraction of the memory; the
+    # old read forced every column to Python-object str)
+    return pacsv.read_csv(
+        fpath,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20),
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in WANTED},
+            strings_can_be_null=True,
+            include_columns=keep,
+        ),
+    )
+
+
+def _fips_filter_table(table):
+    """
+    Arrow-side FIPS derivation and county filter, shared by the
+    in-memory and batched paths: digit-extract and zero-pad
+    _state/ctycode, append their concatenation as `fips`, and drop the
+    000 placeholder-county rows — all through C++ kernels.
+    """
+    # --- 2. Try County-Level FIPS (Arrow-side) ---
+    # digit extraction and zero-padding through Arrow's C++ kernels
+    # instead of a per-row pandas regex over object strings
+    state = pc.utf8_lpad(
+        pc.fill_null(
+            pc.struct_field(pc.extract_regex(table["_state"], r"(?P<d>\d+)"), "d"),
+            "",
+        ),
+        2, padding="0",
+    )
+    cty = pc.utf8_lpad(
+        pc.fill_null(
+            pc.struct_field(pc.extract_regex(table["ctycode"], r"(?P<d>\d+)"), "d"),
+            "",
+        ),
+        3, padding="0",
+    )
+    table = table.set_column(
+        table.schema.get_field_index("_state"), "_state", state
+    )
+    table = table.set_column(
+        table.schema.get_field_index("ctycode"), "ctycode", cty
+    )
+    # one C-level concat of the padded code arrays; the pandas `+` it
+    # replaces allocated a fresh string object per row
+    table = table.append_column(
+        "fips", pc.binary_join_element_wise(state, cty, "")
+    )
+
+    # Filter to valid county rows only (exclude 000 placeholder counties)
+    # while still Arrow-side: the dropped rows never get pandas blocks
+    # or an index built for them
+    return table.filter(pc.not_equal(table["ctycode"], "000"))
+
+
+@lru_cache(maxsize=1)
+def _crosswalk_join_table():
+    """Deduplicated fips -> names crosswalk for Arrow-side joins."""
+    cw = _load_crosswalk().select(["fips", "county_name", "state_name"])
+    # first occurrence per fips, mirroring drop_duplicates("fips")
+    return pa.Table.from_pandas(
+        cw.to_pandas().drop_duplicates("fips"), preserve_index=False
+    )
+
+
+def _process_one_year_batched(task, verbose=False):
+    """
+    Streaming variant for years whose CSV would not fit in memory:
+    Arrow's incremental CSV reader hands back record batches that go
+    through the same FIPS/filter kernels, pick up names via an Arrow
+    join, and are appended to one ParquetWriter per thematic output.
+    Peak memory is O(batch), not O(file).
+    """
+    year, fpath = task
+    if verbose:
+        print(f"\nProcessing year {year} (batched): {fpath}")
+
+    sniff = pacsv.open_csv(
+        fpath, read_options=pacsv.ReadOptions(block_size=1 << 16)
+    )
+    keep = list(_keep_for_header(tuple(sniff.schema.names)))
+
+    reader = pacsv.open_csv(
+        fpath,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20),
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in WANTED},
+            strings_can_be_null=True,
+            include_columns=keep,
+        ),
+    )
+
+    outputs = [
+        (SOCIO_CORE, f"full_brfss_{year}_socioeconomics_core"),
+        (HEALTH_CORE, f"full_brfss_{year}_health_core"),
+        (SOCIO_EXP, f"full_brfss_{year}_socioeconomics_expanded"),
+        (HEALTH_EXP, f"full_brfss_{year}_health_expanded"),
+    ]
+    writers = {}
+    try:
+        for batch in reader:
+            t = _fips_filter_table(pa.Table.from_batches([batch]))
+            t = t.join(
+                _crosswalk_join_table(), keys="fips", join_type="left outer"
+            )
+            t = t.rename_columns(
+                [COLUMN_MAP.get(c) or c for c in t.column_names]
+            )
+            for var_list, stem in outputs:
+                cols = list(
+                    _present(GEO_COLS + var_list, set(t.column_names))
+                )
+                part = t.select(cols)
+                if stem not in writers:
+                    writers[stem] = pq.ParquetWriter(
+                        os.path.join(OUT_DIR, stem + ".parquet"),
+                        part.schema,
+                        compression="zstd", compression_level=3,
+                    )
+                writers[stem].write_table(part)
+    finally:
+        for w in writers.values():
+            w.close()
+
+    print("Saved 4 BRFSS outputs in:", os.path.abspath(OUT_DIR))
+    for _, stem in outputs:
+        print(f"   - {stem}.parquet")
+    return year
+
+
+# above this size, a year's CSV is streamed batch by batch instead of
+# being materialized as one table
+BATCHED_BYTES = 1 << 30
+
+
+def _process_one_year(task, output_format, verbose=False):
+    """Process a single (year, fpath) pair; the body of the old per-year loop."""
+    year, fpath = task
+    # polars, if installed, handles the CSV-to-flat-Parquet route end to
+    # end; Parquet input, csv/dataset output and polars-less runs take
+    # the Arrow/pandas route
+    is_csv_input = fpath.endswith(".csv")
+    if pl is not None and output_format == "parquet" and is_csv_input:
+        return _process_one_year_polars(task, verbose)
+    # oversized years stream through the batched path rather than being
+    # materialized whole
+    if (output_format == "parquet" and is_csv_input
+            and os.path.getsize(fpath) > BATCHED_BYTES):
+        return _process_one_year_batched(task, verbose)
+    TEST_YEAR = year
+    if verbose:
+        print(f"\nProcessing year {TEST_YEAR}: {fpath}")
+
+    table = _fips_filter_table(_read_year_table(fpath))
+    if verbose:
+        print("Remaining rows with valid county codes:", table.num_rows)
+
+    # Arrow-backed strings keep the downstream .str ops off Python objects
+    brfss = table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    if verbose:
+        print(f"\n[{TEST_YEAR}] Preview of raw BRFSS file:")
+        print(brfss.head())
+        print("BRFSS shape:", brfss.shape)
+
+    if verbose:
+        print("Sample FIPS after filter:", brfss["fips"].unique()[:10])
+
+    # --- 3. Merge Geography ---
+    if verbose:
+        print("Using county-level FIPS for lookup")
+
+    # hash the fips column against the crosswalk index once, then one
+    # C-level gather per name column — no per-row dict lookups
+    cw_index, county_names, state_names = _crosswalk_gather_arrays()
+    idx = cw_index.get_indexer(brfss["fips"].to_numpy())
+    found = idx >= 0
+    safe = idx.clip(min=0)
+    brfss["county_name"] = np.where(found, county_names[safe], None)
+    brfss["state_name"] = np.where(found, state_names[safe], None)
+
+    if verbose:
+        print("Rows after lookup:", len(brfss))
+        print("Sample with names:", brfss[["fips", "state_name", "county_name"]].head())
+        print("Unique _state codes:", brfss["_state"].nunique())
+        print("Unique ctycode codes:", brfss["ctycode"].nunique())
+
+    # After merge, how many matched?
+    matched = brfss["county_name"].notna().sum()
+    total = len(brfss)
+
+    if verbose:
+        print(f"Matched county names: {matched}/{total} ({matched/total:.1%})")
+
+    # Apply to dataset — with copy-on-write the rename is a label-only
+    # operation; copy=False makes the shared-data intent explicit
+    brfss = brfss.rename(columns=COLUMN_MAP, copy=False)
+
+    # dictionary-encode the low-cardinality columns before building the
+    # Arrow table (categories -> dictionary arrays -> dictionary pages)
+    for c in LOW_CARD & set(brfss.columns):
+        brfss[c] = brfss[c].astype("category")
+
+    # --- One Arrow table for the year; each thematic output is a
+    # zero-copy column projection of it, so the four variants no longer
+    # each allocate their own index and block manager ---
+    full = pa.Table.from_pandas(brfss, preserve_index=False)
+
+    # present columns once per year: set membership beats scanning the
+    # schema name list for every candidate column of every variant
+    cols_set = set(full.schema.names)
+
+    if output_format == "dataset":
+        themes = [
+            (_present(GEO_COLS + SOCIO_CORE, cols_set), "socio_core"),
+            (_present(GEO_COLS + HEALTH_CORE, cols_set), "health_core"),
+            (_present(GEO_COLS + SOCIO_EXP, cols_set), "socio_expanded"),
+            (_present(GEO_COLS + HEALTH_EXP, cols_set), "health_expanded"),
+        ]
+        for cols, theme in themes:
+            part = full.select(cols).append_column(
+                "theme", pa.array([theme] * full.num_rows)
+            )
+            ds.write_dataset(
+                part, DATASET_DIR,
+                partitioning=["survey_year", "theme"],
+                format="parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+        print(
+            f"Appended year {TEST_YEAR} (4 themes) to dataset:",
+            os.path.abspath(DATASET_DIR),
+        )
+        return year
+
+    # --- Save outputs to processed/ (Parquet writes ~10x faster than
+    # CSV for these frames and keeps dtypes; CSV stays available via
+    # output_format="csv" for legacy consumers) ---
+    outputs = [
+        (full.select(_present(GEO_COLS + SOCIO_CORE, cols_set)),
+         f"full_brfss_{TEST_YEAR}_socioeconomics_core"),
+        (full.select(_present(GEO_COLS + HEALTH_CORE, cols_set)),
+         f"full_brfss_{TEST_YEAR}_health_core"),
+        (full.select(_present(GEO_COLS + SOCIO_EXP, cols_set)),
+         f"full_brfss_{TEST_YEAR}_socioeconomics_expanded"),
+        (full.select(_present(GEO_COLS + HEALTH_EXP, cols_set)),
+         f"full_brfss_{TEST_YEAR}_health_expanded"),
+    ]
+    ext = "csv" if output_format == "csv" else "parquet"
+    # the Arrow writers release the GIL for compression and disk I/O, so
+    # four threads overlap the four files' writes instead of serializing
+    # them
+    with ThreadPoolExecutor(max_workers=len(outputs)) as writers:
+        list(writers.map(
+            lambda out: _write_output(
+                out[0], os.path.join(OUT_DIR, out[1]), output_format
+            ),
+            outputs,
+        ))
+
+    print("Saved 4 BRFSS outputs in:", os.path.abspath(OUT_DIR))
+    for _, stem in outputs:
+        print(f"   - {stem}.{ext}")
+
+    if verbose:
+        for out_table, stem in outputs:
+            print(f"[{TEST_YEAR}] {stem}: "
+                  f"({out_table.num_rows}, {out_table.num_columns})")
+
+    return year
+
+
+def _write_output(table, path_base, output_format):
+    """One thematic Arrow projection to disk: flat zstd Parquet or legacy CSV."""
+    if output_format == "csv":
+        # stream 64k-row batches through the C++ formatter; the whole
+        # file is never held as one formatted blob in memory
+        pacsv.write_csv(
+            table, path_base + ".csv",
+            write_options=pacsv.WriteOptions(
+                include_header=True, batch_size=1 << 16,
+            ),
+        )
+    else:
+        pq.write_table(
+            table, path_base + ".parquet",
+            compression="zstd", compression_level=3,
+        )
+
+
+def process_brfss(year_list, verbose=False, output_format="dataset"):
+    os.makedirs(OUT_DIR, exist_ok=True)
+    csv_files = list_year_files()
+    print(f"Found {len(csv_files)} yearly files")
+
+    # pair each requested year with its file up front: one anchored
+    # regex pass over the listing instead of a substring test per
+    # (file, year) pair — "2001" can no longer match inside another
+    # number in the filename
+    year_pat = re.compile(
+        rf"brfss_({'|'.join(re.escape(str(y)) for y in year_list)})"
+        r"\.(?:parquet|csv)$"
+    )
+    by_year = {}
+    for f in csv_files:
+        m = year_pat.search(os.path.basename(f))
+        if m:
+            by_year[int(m.group(1))] = f
+    pairs = []
+    for year in year_list:
+        if year not in by_year:
+            print("Invalid year specified, skipping")
+            continue
+        pairs.append((year, by_year[year]))
+    if not pairs:
+        return
+
+    # years are independent, so fan them out across processes; the
+    # pandas/Arrow work in each holds the GIL, so threads would not help
+    # each worker lazily loads and caches the small crosswalk itself, so
+    # nothing crosswalk-sized is pickled across the process boundary
+    max_workers = min(len(pairs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        list(ex.map(
+            partial(
+                _process_one_year,
+                output_format=output_format,
+                verbose=verbose,
+            ),
+            pairs,
+        ))
+
+    return